@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Two-stage cascade for road defect detection.
+
+A tiny low-resolution binary classifier ("is there a defect?") runs first and
+only images whose gate score passes a calibrated threshold are sent to the
+full YOLOv5 detector. The gate is trained from the existing labelled splits:
+an image with a non-empty label file is a positive, an image with an existing
+but empty label file is clean pavement (YOLO's convention for background
+images). Images without a label file are skipped.
+
+The labelled splits contain almost no clean images, so negatives also come
+from background tiles: each image with hand-drawn boxes is cut into a
+TILE_GRID x TILE_GRID grid and every tile that does not touch a box is used as
+clean pavement. Placeholder boxes written by generate_dummy_labels.py and
+setup_dataset.py do not say where the defect is, so those images give no tiles.
+
+The gate is fitted on the train split, its threshold is calibrated on the val
+split, and the cascade is evaluated on the test split, so the reported recall
+lost comes from images the gate has never seen.
+
+Usage:
+    python cascade_gate.py train      # train on train, calibrate the threshold on val
+    python cascade_gate.py evaluate   # skip rate, throughput gain and recall lost on test
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import transforms
+
+# Configuration
+DATA_DIR = Path("road_defects_dataset")
+DETECTOR_WEIGHTS = "yolov5/runs/train/road_defects_model4/weights/best.pt"
+GATE_WEIGHTS = "defect_gate.pt"
+GATE_IMG_SIZE = 64
+DETECTOR_IMG_SIZE = 640
+TARGET_RECALL = 0.98
+# Fewest images of each class the gate needs to be trained or calibrated on
+MIN_CLASS_SAMPLES = 5
+TILE_GRID = 3
+# Boxes written by generate_dummy_labels.py and setup_dataset.py, not real annotations
+PLACEHOLDER_BOXES = {(0.5, 0.5, 0.1, 0.1), (0.5, 0.5, 0.8, 0.8)}
+IMAGE_SUFFIXES = ['.jpg', '.jpeg', '.png']
+
+
+class DefectGate(nn.Module):
+    """Small CNN returning one logit for "defect present"."""
+
+    def __init__(self):
+        super().__init__()
+        self.features = nn.Sequential(
+            nn.Conv2d(3, 16, 3, stride=2, padding=1),
+            nn.BatchNorm2d(16),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(16, 32, 3, stride=2, padding=1),
+            nn.BatchNorm2d(32),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(32, 64, 3, stride=2, padding=1),
+            nn.BatchNorm2d(64),
+            nn.ReLU(inplace=True),
+            nn.AdaptiveAvgPool2d(1),
+        )
+        self.classifier = nn.Linear(64, 1)
+
+    def forward(self, x):
+        return self.classifier(torch.flatten(self.features(x), 1)).squeeze(1)
+
+
+def gate_transform(img_size=GATE_IMG_SIZE, augment=False):
+    """Preprocessing applied to every image before it reaches the gate."""
+    steps = [transforms.Resize((img_size, img_size))]
+    if augment:
+        steps += [transforms.RandomHorizontalFlip(), transforms.ColorJitter(0.2, 0.2)]
+    steps.append(transforms.ToTensor())
+    return transforms.Compose(steps)
+
+
+def load_split(split, data_dir=DATA_DIR):
+    """Return (image_path, has_defect) pairs for a dataset split.
+
+    Only images with a label file are used: an empty label file marks a clean
+    background image, a missing one means the image was never labelled.
+    """
+    img_dir = data_dir / 'images' / split
+    label_dir = data_dir / 'labels' / split
+
+    samples = []
+    skipped = 0
+    for img_path in sorted(img_dir.glob('*')):
+        if img_path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        label_path = label_dir / f"{img_path.stem}.txt"
+        if not label_path.exists():
+            skipped += 1
+            continue
+        has_defect = label_path.read_text(encoding='utf-8').strip() != ''
+        samples.append((img_path, int(has_defect)))
+
+    if skipped:
+        print(f"⚠️ Skipped {skipped} unlabelled images in {split}")
+    return samples
+
+
+def read_boxes(label_path):
+    """Normalised (x_center, y_center, width, height) boxes of a YOLO label file."""
+    boxes = []
+    for line in label_path.read_text(encoding='utf-8').splitlines():
+        if line.strip():
+            boxes.append(tuple(float(v) for v in line.split()[1:5]))
+    return boxes
+
+
+def background_tiles(split, data_dir=DATA_DIR, grid=TILE_GRID):
+    """Return (image_path, tile) pairs for grid tiles that do not touch any labelled box.
+
+    A tile is a normalised (x0, y0, x1, y1) rectangle. Only images whose label
+    file holds real annotations are used.
+    """
+    img_dir = data_dir / 'images' / split
+    label_dir = data_dir / 'labels' / split
+
+    tiles = []
+    for img_path in sorted(img_dir.glob('*')):
+        if img_path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        label_path = label_dir / f"{img_path.stem}.txt"
+        if not label_path.exists():
+            continue
+        boxes = read_boxes(label_path)
+        if not boxes or all(box in PLACEHOLDER_BOXES for box in boxes):
+            continue
+
+        for i in range(grid):
+            for j in range(grid):
+                x0, y0, x1, y1 = i / grid, j / grid, (i + 1) / grid, (j + 1) / grid
+                if all(min(x1, x + w / 2) <= max(x0, x - w / 2) or min(y1, y + h / 2) <= max(y0, y - h / 2)
+                       for x, y, w, h in boxes):
+                    tiles.append((img_path, (x0, y0, x1, y1)))
+    return tiles
+
+
+def load_samples(split, data_dir=DATA_DIR):
+    """Return (PIL image, has_defect) pairs: labelled images plus background tiles."""
+    samples = [(Image.open(p).convert('RGB'), y) for p, y in load_split(split, data_dir)]
+    for img_path, (x0, y0, x1, y1) in background_tiles(split, data_dir):
+        image = Image.open(img_path).convert('RGB')
+        w, h = image.size
+        samples.append((image.crop((round(x0 * w), round(y0 * h), round(x1 * w), round(y1 * h))), 0))
+    return samples
+
+
+def count_classes(samples):
+    """Number of (defect, clean) images in a list of samples."""
+    n_pos = sum(y for _, y in samples)
+    return n_pos, len(samples) - n_pos
+
+
+def has_enough_samples(samples, split):
+    """Check that a split has enough defect and clean images, reporting what is missing."""
+    n_pos, n_neg = count_classes(samples)
+    print(f"📊 {split} split: {n_pos} with defects, {n_neg} clean")
+    if n_pos < MIN_CLASS_SAMPLES:
+        print(f"❌ Need at least {MIN_CLASS_SAMPLES} labelled defect images in {split}, found {n_pos}")
+        return False
+    if n_neg < MIN_CLASS_SAMPLES:
+        print(f"❌ Need at least {MIN_CLASS_SAMPLES} clean images (empty label files or background tiles) "
+              f"in {split}, found {n_neg}")
+        return False
+    return True
+
+
+def calibrate_threshold(scores, labels, target_recall=TARGET_RECALL):
+    """Highest threshold that still lets `target_recall` of the positives through."""
+    positives = sorted((s for s, y in zip(scores, labels) if y), reverse=True)
+    if not positives:
+        return 0.5
+    # Number of positives that must pass; the threshold sits on the weakest of them
+    keep = min(len(positives), max(1, math.ceil(target_recall * len(positives))))
+    return positives[keep - 1]
+
+
+def load_gate(path=GATE_WEIGHTS, device='cpu'):
+    """Load a trained gate and its checkpoint (threshold, input size, calibration split)."""
+    checkpoint = torch.load(path, map_location=device)
+    gate = DefectGate().to(device)
+    gate.load_state_dict(checkpoint['state_dict'])
+    gate.eval()
+    return gate, checkpoint
+
+
+@torch.no_grad()
+def gate_score(gate, image, transform, device='cpu'):
+    """Probability that a PIL image contains a defect.
+
+    `transform` is built once with gate_transform() and reused for every image.
+    """
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    x = transform(image).unsqueeze(0).to(device)
+    return torch.sigmoid(gate(x)).item()
+
+
+def load_detector(path=DETECTOR_WEIGHTS):
+    """Load the full YOLOv5 detector, shared by the Streamlit app and `evaluate`."""
+    model = torch.hub.load('ultralytics/yolov5', 'custom', path=path, force_reload=False)
+    model.conf = 0.01  # Low threshold so every possible detection is shown
+    model.iou = 0.45
+    return model
+
+
+def train_gate(epochs=30, batch_size=16, lr=1e-3, img_size=GATE_IMG_SIZE, target_recall=TARGET_RECALL,
+               calibration_split='val', output=GATE_WEIGHTS, device='cpu'):
+    """Train the gate on the train split and calibrate its threshold on a held-out split."""
+    samples = load_samples('train')
+    calibration = load_samples(calibration_split)
+    if not has_enough_samples(samples, 'train') or not has_enough_samples(calibration, calibration_split):
+        return None
+    n_pos, n_neg = count_classes(samples)
+
+    images = [img for img, _ in samples]
+    labels = [y for _, y in samples]
+    augment = gate_transform(img_size, augment=True)
+    plain = gate_transform(img_size)
+
+    gate = DefectGate().to(device)
+    optimizer = torch.optim.Adam(gate.parameters(), lr=lr)
+    # Weight the positives so both classes contribute equally to the loss
+    pos_weight = torch.tensor([n_neg / n_pos], device=device)
+    criterion = nn.BCEWithLogitsLoss(pos_weight=pos_weight)
+
+    order = list(range(len(samples)))
+    for epoch in range(epochs):
+        gate.train()
+        random.shuffle(order)
+        total_loss = 0.0
+        for i in range(0, len(order), batch_size):
+            batch = order[i:i + batch_size]
+            x = torch.stack([augment(images[j]) for j in batch]).to(device)
+            y = torch.tensor([labels[j] for j in batch], dtype=torch.float32, device=device)
+            optimizer.zero_grad()
+            loss = criterion(gate(x), y)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(batch)
+        print(f"Epoch {epoch + 1}/{epochs} - loss {total_loss / len(order):.4f}")
+
+    gate.eval()
+    scores = [gate_score(gate, img, plain, device) for img, _ in calibration]
+    threshold = calibrate_threshold(scores, [y for _, y in calibration], target_recall)
+    print(f"🎯 Calibrated threshold {threshold:.4f} for {target_recall:.0%} recall on {calibration_split}")
+
+    torch.save({'state_dict': gate.state_dict(), 'threshold': threshold, 'img_size': img_size,
+                'calibration_split': calibration_split}, output)
+    print(f"✅ Gate saved to {output}")
+    return output
+
+
+def evaluate_cascade(split='test', gate_path=GATE_WEIGHTS, detector_path=DETECTOR_WEIGHTS, device='cpu'):
+    """Compare detector-only and cascade runs on a split."""
+    samples = load_samples(split)
+    if not count_classes(samples)[0]:
+        print(f"❌ No labelled defect images found in the {split} split")
+        return None
+
+    gate, checkpoint = load_gate(gate_path, device)
+    threshold = checkpoint['threshold']
+    transform = gate_transform(checkpoint['img_size'])
+    if split in ('train', checkpoint.get('calibration_split')):
+        print(f"⚠️ The gate was trained or calibrated on {split}, recall lost will be optimistic")
+    model = load_detector(detector_path)
+    images = [img for img, _ in samples]
+    labels = [y for _, y in samples]
+
+    # Warm up both models so the first call does not skew the timings
+    gate_score(gate, images[0], transform, device)
+    model(images[0], size=DETECTOR_IMG_SIZE)
+
+    start = time.perf_counter()
+    full_hits = [len(model(img, size=DETECTOR_IMG_SIZE).xyxy[0]) > 0 for img in images]
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    passed = []
+    for img in images:
+        passed.append(gate_score(gate, img, transform, device) >= threshold)
+        if passed[-1]:
+            model(img, size=DETECTOR_IMG_SIZE)
+    cascade_time = time.perf_counter() - start
+    cascade_hits = [hit and gate_ok for hit, gate_ok in zip(full_hits, passed)]
+
+    n_pos = sum(labels)
+    full_recall = sum(h for h, y in zip(full_hits, labels) if y) / n_pos if n_pos else 0.0
+    cascade_recall = sum(h for h, y in zip(cascade_hits, labels) if y) / n_pos if n_pos else 0.0
+    report = {
+        'images': len(samples),
+        'threshold': threshold,
+        'skip_rate': 1 - sum(passed) / len(passed),
+        'full_fps': len(images) / full_time,
+        'cascade_fps': len(images) / cascade_time,
+        'speedup': full_time / cascade_time,
+        'full_recall': full_recall,
+        'cascade_recall': cascade_recall,
+        'recall_lost': full_recall - cascade_recall,
+    }
+
+    n_pos, n_neg = count_classes(samples)
+    print(f"\n📊 Cascade evaluation on {split} ({n_pos} defect images, {n_neg} clean images and tiles)")
+    print(f"Gate threshold:     {report['threshold']:.4f}")
+    print(f"Skip rate:          {report['skip_rate']:.1%}")
+    print(f"Detector only:      {report['full_fps']:.2f} img/s")
+    print(f"Cascade:            {report['cascade_fps']:.2f} img/s ({report['speedup']:.2f}x)")
+    print(f"Image recall:       {report['full_recall']:.1%} -> {report['cascade_recall']:.1%}")
+    print(f"Recall lost:        {report['recall_lost']:.1%}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Defect-present gate for the YOLOv5 detector")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help="train the gate and calibrate its threshold")
+    train_parser.add_argument('--epochs', type=int, default=30)
+    train_parser.add_argument('--batch', type=int, default=16)
+    train_parser.add_argument('--img', type=int, default=GATE_IMG_SIZE)
+    train_parser.add_argument('--target-recall', type=float, default=TARGET_RECALL)
+    train_parser.add_argument('--calibration-split', default='val',
+                              help="held-out split used to calibrate the threshold")
+    train_parser.add_argument('--output', default=GATE_WEIGHTS)
+
+    eval_parser = subparsers.add_parser('evaluate', help="measure skip rate, speedup and recall lost")
+    eval_parser.add_argument('--split', default='test',
+                             help="split to evaluate on, keep it apart from the calibration split")
+    eval_parser.add_argument('--gate', default=GATE_WEIGHTS)
+    eval_parser.add_argument('--weights', default=DETECTOR_WEIGHTS)
+
+    args = parser.parse_args()
+    if args.command == 'train':
+        result = train_gate(epochs=args.epochs, batch_size=args.batch, img_size=args.img,
+                            target_recall=args.target_recall, calibration_split=args.calibration_split,
+                            output=args.output)
+    else:
+        result = evaluate_cascade(split=args.split, gate_path=args.gate, detector_path=args.weights)
+    if result is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Model-compression pipeline for the road defect detector.
+
+Starting from the trained YOLOv5 `best.pt` this script produces a set of
+smaller candidates and compares them so a deployment point can be picked:
+1. Structured channel pruning of the teacher at several sparsity targets.
+   Channels are physically removed (Conv, BatchNorm, C3 and Concat are kept
+   consistent by torch-pruning's dependency graph), then each pruned model is
+   fine-tuned on data.yaml with the teacher as a distillation target
+2. Knowledge distillation from the teacher into narrower and/or
+   lower-resolution students, initialised from the matching pretrained
+   YOLOv5 checkpoint and trained on the same data.yaml
+3. ONNX export of every student
+4. A Pareto table of parameters, FLOPs, CPU latency and mAP per candidate
+
+Usage:
+    python compress_model.py --sparsity 0.2 0.4 --epochs 30 --finetune-epochs 10
+"""
+import argparse
+import csv
+import subprocess
+import sys
+import time
+from copy import deepcopy
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+import torch_pruning as tp
+import yaml
+
+# Configuration
+BASE_DIR = Path(__file__).parent.absolute()
+YOLOV5_DIR = BASE_DIR / "yolov5"
+DETECTOR_WEIGHTS = YOLOV5_DIR / "runs/train/road_defects_model4/weights/best.pt"
+DATA_YAML = BASE_DIR / "data.yaml"
+STUDENT_BASE_CFG = YOLOV5_DIR / "models/yolov5s.yaml"
+HYP_YAML = YOLOV5_DIR / "data/hyps/hyp.scratch-low.yaml"
+OUTPUT_DIR = BASE_DIR / "compressed"
+TEACHER_IMG_SIZE = 640
+SPARSITY_TARGETS = [0.2, 0.4, 0.6]
+
+# Student candidates: (name, depth_multiple, width_multiple, image size, pretrained weights)
+STUDENTS = [
+    ('student_n_640', 0.33, 0.25, 640, 'yolov5n.pt'),
+    ('student_n_416', 0.33, 0.25, 416, 'yolov5n.pt'),
+    ('student_s_320', 0.33, 0.50, 320, 'yolov5s.pt'),
+]
+
+
+def add_yolov5_to_path():
+    """Make the YOLOv5 clone importable (`models`, `utils`, `val`).
+
+    YOLOv5 is cloned next to this script by setup_yolov5.py. It is only put on
+    sys.path by the functions that need it, so the helpers of this module can
+    be imported without the clone.
+    """
+    path = str(YOLOV5_DIR)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_checkpoint_model(weights):
+    """Load the unfused float model stored in a YOLOv5 checkpoint."""
+    add_yolov5_to_path()
+    ckpt = torch.load(weights, map_location='cpu', weights_only=False)
+    return (ckpt.get('ema') or ckpt['model']).float()
+
+
+def save_checkpoint(model, path):
+    """Save a model in the checkpoint layout YOLOv5 val.py and export.py expect."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    torch.save({'model': deepcopy(model).half(), 'epoch': -1}, path)
+    return path
+
+
+def prune_channels(model, sparsity, imgsz=TEACHER_IMG_SIZE):
+    """Remove the lowest-L2 `sparsity` fraction of channels from every layer.
+
+    torch-pruning traces the model to find which convolutions, BatchNorms and
+    concatenations share a channel, so whole channels are cut out and the
+    resulting model is genuinely smaller. The output channels of the head
+    (`model.model[-1]`, YOLOv5's Detect) are left untouched.
+    """
+    if not 0 <= sparsity < 1:
+        raise ValueError(f"sparsity must be in [0, 1), got {sparsity}")
+    if sparsity == 0:
+        return model
+
+    model.eval()
+    # torch-pruning follows the autograd graph, which is empty for the frozen
+    # parameters stored in best.pt
+    model.requires_grad_(True)
+    n_params = sum(p.numel() for p in model.parameters())
+    pruner = tp.pruner.MagnitudePruner(
+        model,
+        torch.zeros(1, 3, imgsz, imgsz),
+        importance=tp.importance.MagnitudeImportance(p=2),
+        pruning_ratio=sparsity,
+        ignored_layers=[model.model[-1]],
+    )
+    pruner.step()
+
+    if sum(p.numel() for p in model.parameters()) >= n_params:
+        raise RuntimeError(f"Pruning at sparsity {sparsity} removed no channels")
+    return model
+
+
+def build_student(depth_multiple, width_multiple, teacher, pretrained=None):
+    """Build a narrower YOLOv5 that shares the teacher's classes and anchors."""
+    add_yolov5_to_path()
+    from models.yolo import Model
+    from utils.downloads import attempt_download
+    from utils.general import intersect_dicts
+
+    with open(STUDENT_BASE_CFG, encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+    cfg['depth_multiple'] = depth_multiple
+    cfg['width_multiple'] = width_multiple
+
+    student = Model(cfg, ch=3, nc=teacher.nc)
+    if pretrained:
+        # Transfer every layer whose shape matches, as yolov5/train.py does
+        ckpt = torch.load(attempt_download(pretrained), map_location='cpu', weights_only=False)
+        csd = intersect_dicts(ckpt['model'].float().state_dict(), student.state_dict(), exclude=['anchor'])
+        student.load_state_dict(csd, strict=False)
+        print(f"Transferred {len(csd)}/{len(student.state_dict())} items from {pretrained}")
+
+    # Same anchors as the teacher so the raw head outputs can be matched one to one
+    student.model[-1].anchors = teacher.model[-1].anchors.clone()
+    student.nc = teacher.nc
+    student.names = teacher.names
+    return student
+
+
+def bernoulli_kl(student_logits, teacher_logits):
+    """Element-wise KL divergence between the teacher's and the student's sigmoid outputs."""
+    target = teacher_logits.sigmoid()
+    return (F.binary_cross_entropy_with_logits(student_logits, target, reduction='none')
+            - F.binary_cross_entropy_with_logits(teacher_logits, target, reduction='none'))
+
+
+def distillation_loss(student_out, teacher_out):
+    """Match the student's raw head outputs to the teacher's.
+
+    Objectness is learnt from the teacher's soft scores everywhere, box and
+    class outputs only where the teacher believes there is an object. The
+    loss is zero when the student reproduces the teacher exactly.
+    """
+    loss = 0.0
+    for s, t in zip(student_out, teacher_out):
+        weight = t[..., 4:5].sigmoid()
+        loss = loss + bernoulli_kl(s[..., 4], t[..., 4]).mean()
+        loss = loss + (weight * (s[..., :4] - t[..., :4]) ** 2).mean()
+        loss = loss + (weight * bernoulli_kl(s[..., 5:], t[..., 5:])).mean()
+    return loss
+
+
+def train_with_teacher(model, teacher, name, imgsz, epochs=30, batch_size=16, alpha=1.0, device='cpu'):
+    """Train a model on data.yaml with the ground-truth and distillation losses.
+
+    Follows the yolov5/train.py recipe: warmup, cosine LR decay and an EMA of
+    the weights, which is what gets saved.
+    """
+    add_yolov5_to_path()
+    from utils.dataloaders import create_dataloader
+    from utils.general import check_dataset, one_cycle
+    from utils.loss import ComputeLoss
+    from utils.torch_utils import ModelEMA
+
+    with open(HYP_YAML, encoding='utf-8') as f:
+        hyp = yaml.safe_load(f)
+    # Scale the loss gains the same way yolov5/train.py does
+    nl = model.model[-1].nl
+    hyp['box'] *= 3 / nl
+    hyp['cls'] *= model.nc / 80 * 3 / nl
+    hyp['obj'] *= (imgsz / 640) ** 2 * 3 / nl
+    model.hyp = hyp
+    model.requires_grad_(True)
+
+    data = check_dataset(str(DATA_YAML))
+    stride = int(model.stride.max())
+    loader, _ = create_dataloader(data['train'], imgsz, batch_size, stride, hyp=hyp,
+                                  augment=True, shuffle=True, prefix=f'{name}: ')
+
+    compute_loss = ComputeLoss(model)
+    optimizer = torch.optim.SGD(model.parameters(), lr=hyp['lr0'], momentum=hyp['momentum'],
+                                nesterov=True, weight_decay=hyp['weight_decay'])
+    lf = one_cycle(1, hyp['lrf'], epochs)
+    scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lr_lambda=lf)
+    ema = ModelEMA(model)
+
+    nb = len(loader)
+    # train.py warms up for at least 100 iterations, longer than a whole run on this dataset
+    nw = max(round(hyp['warmup_epochs'] * nb), 1)
+    for epoch in range(epochs):
+        model.train()
+        total_loss = 0.0
+        for i, (imgs, targets, _, _) in enumerate(loader):
+            ni = i + nb * epoch
+            if ni < nw:
+                ramp = (ni + 1) / nw
+                for g in optimizer.param_groups:
+                    g['lr'] = g['initial_lr'] * lf(epoch) * ramp
+                    g['momentum'] = hyp['warmup_momentum'] + (hyp['momentum'] - hyp['warmup_momentum']) * ramp
+
+            imgs = imgs.to(device).float() / 255
+            targets = targets.to(device)
+            with torch.no_grad():
+                teacher_out = teacher(imgs)[1]
+            out = model(imgs)
+            gt_loss, _ = compute_loss(out, targets)
+            loss = gt_loss + alpha * distillation_loss(out, teacher_out) * imgs.shape[0]
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            ema.update(model)
+            total_loss += loss.item()
+        scheduler.step()
+        print(f"Epoch {epoch + 1}/{epochs} - loss {total_loss / nb:.4f} - lr {optimizer.param_groups[0]['lr']:.5f}")
+
+    return save_checkpoint(ema.ema, OUTPUT_DIR / f'{name}.pt')
+
+
+def load_teacher(weights, device='cpu'):
+    """Load the fused teacher used as the distillation target."""
+    add_yolov5_to_path()
+    from models.experimental import attempt_load
+
+    teacher = attempt_load(weights, device=device)
+    teacher.eval()
+    return teacher
+
+
+def prune_and_finetune(weights, sparsity, epochs=10, batch_size=16, device='cpu'):
+    """Prune the teacher and recover its accuracy by fine-tuning against it."""
+    name = f'pruned_{round(sparsity * 100)}'
+    print(f"\n✂️  Pruning {sparsity:.0%} of the channels ({name})")
+    model = prune_channels(load_checkpoint_model(weights), sparsity).to(device)
+    return train_with_teacher(model, load_teacher(weights, device), name, TEACHER_IMG_SIZE,
+                              epochs=epochs, batch_size=batch_size, device=device)
+
+
+def distill_student(name, depth_multiple, width_multiple, imgsz, pretrained, teacher_weights,
+                    epochs=30, batch_size=16, device='cpu'):
+    """Build one student and distill the teacher into it."""
+    print(f"\n🎓 Distilling {name} (depth {depth_multiple}, width {width_multiple}, {imgsz}px)")
+    teacher = load_teacher(teacher_weights, device)
+    student = build_student(depth_multiple, width_multiple, teacher, pretrained).to(device)
+    return train_with_teacher(student, teacher, name, imgsz, epochs=epochs, batch_size=batch_size,
+                              device=device)
+
+
+def export_student(weights, imgsz):
+    """Export a student to ONNX with the YOLOv5 exporter."""
+    cmd = [
+        sys.executable, str(YOLOV5_DIR / 'export.py'),
+        '--weights', str(weights),
+        '--imgsz', str(imgsz),
+        '--include', 'onnx'
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def count_params_flops(model, imgsz):
+    """Dense parameter count and convolution FLOPs for one image."""
+    params = sum(p.numel() for p in model.parameters())
+    flops = 0
+
+    def hook(module, inputs, output):
+        nonlocal flops
+        # Each weight is one multiply-add per output pixel
+        flops += 2 * module.weight.numel() * output.shape[2] * output.shape[3]
+
+    handles = [m.register_forward_hook(hook) for m in model.modules() if isinstance(m, torch.nn.Conv2d)]
+    with torch.no_grad():
+        model(torch.zeros(1, 3, imgsz, imgsz))
+    for h in handles:
+        h.remove()
+    return params, flops
+
+
+def measure_cpu_latency(model, imgsz, runs=20):
+    """Mean single-image CPU latency in milliseconds."""
+    x = torch.zeros(1, 3, imgsz, imgsz)
+    with torch.no_grad():
+        for _ in range(3):
+            model(x)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(x)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def evaluate_candidate(name, weights, imgsz, batch_size=16, device='cpu'):
+    """Size, speed and accuracy of one candidate on the val split.
+
+    Latency is always measured on CPU, the deployment target; mAP is computed
+    on `device`.
+    """
+    add_yolov5_to_path()
+    import val as yolov5_val
+    from models.experimental import attempt_load
+
+    model = attempt_load(weights, device='cpu')
+    model.eval()
+    params, flops = count_params_flops(model, imgsz)
+    latency = measure_cpu_latency(model, imgsz)
+    (_, _, map50, map50_95, *_), _, _ = yolov5_val.run(
+        data=str(DATA_YAML), weights=str(weights), imgsz=imgsz, batch_size=batch_size,
+        device=str(device), plots=False)
+    return {
+        'name': name,
+        'imgsz': imgsz,
+        'params': params,
+        'gflops': flops / 1e9,
+        'cpu_ms': latency,
+        'map50': map50,
+        'map50_95': map50_95,
+    }
+
+
+def mark_pareto(rows):
+    """Flag candidates that no other candidate beats on every axis."""
+    def dominates(a, b):
+        no_worse = (a['params'] <= b['params'] and a['gflops'] <= b['gflops']
+                    and a['cpu_ms'] <= b['cpu_ms'] and a['map50_95'] >= b['map50_95'])
+        better = (a['params'] < b['params'] or a['gflops'] < b['gflops']
+                  or a['cpu_ms'] < b['cpu_ms'] or a['map50_95'] > b['map50_95'])
+        return no_worse and better
+
+    for row in rows:
+        row['pareto'] = not any(dominates(other, row) for other in rows if other is not row)
+    return rows
+
+
+def write_pareto_table(rows, path):
+    """Print the candidate table and save it as CSV."""
+    rows = sorted(rows, key=lambda r: r['cpu_ms'])
+    header = f"{'candidate':<20}{'img':>6}{'params':>12}{'GFLOPs':>9}{'CPU ms':>9}{'mAP50':>8}{'mAP50-95':>10}  pareto"
+    print("\n📊 Compression candidates")
+    print(header)
+    print('-' * len(header))
+    for r in rows:
+        print(f"{r['name']:<20}{r['imgsz']:>6}{r['params']:>12,}{r['gflops']:>9.2f}{r['cpu_ms']:>9.1f}"
+              f"{r['map50']:>8.3f}{r['map50_95']:>10.3f}  {'✅' if r['pareto'] else ''}")
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\n✅ Table saved to {path}")
+
+
+def run_pipeline(weights=DETECTOR_WEIGHTS, sparsity_targets=SPARSITY_TARGETS, students=STUDENTS,
+                 epochs=30, finetune_epochs=10, batch_size=16, export=True, device='cpu'):
+    """Prune, distill, export and compare all candidates.
+
+    Training runs on `device`; CPU latency is measured on CPU regardless.
+    """
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    candidates = [('teacher', Path(weights), TEACHER_IMG_SIZE)]
+
+    for sparsity in sparsity_targets:
+        path = prune_and_finetune(weights, sparsity, epochs=finetune_epochs, batch_size=batch_size,
+                                  device=device)
+        candidates.append((path.stem, path, TEACHER_IMG_SIZE))
+
+    for name, depth_multiple, width_multiple, imgsz, pretrained in students:
+        path = distill_student(name, depth_multiple, width_multiple, imgsz, pretrained, weights,
+                               epochs=epochs, batch_size=batch_size, device=device)
+        if export:
+            export_student(path, imgsz)
+        candidates.append((name, path, imgsz))
+
+    rows = [evaluate_candidate(name, path, imgsz, batch_size, device) for name, path, imgsz in candidates]
+    write_pareto_table(mark_pareto(rows), OUTPUT_DIR / 'pareto.csv')
+    return rows
+
+
+def sparsity_target(value):
+    """argparse type for a pruning fraction in [0, 1)."""
+    sparsity = float(value)
+    if not 0 <= sparsity < 1:
+        raise argparse.ArgumentTypeError(f"sparsity must be in [0, 1), got {value}")
+    return sparsity
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune and distill the road defect detector")
+    parser.add_argument('--weights', default=str(DETECTOR_WEIGHTS), help="trained teacher best.pt")
+    parser.add_argument('--sparsity', type=sparsity_target, nargs='+', default=SPARSITY_TARGETS,
+                        help="fractions of channels to prune, each in [0, 1)")
+    parser.add_argument('--epochs', type=int, default=30, help="distillation epochs per student")
+    parser.add_argument('--finetune-epochs', type=int, default=10, help="fine-tuning epochs per pruned model")
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--device', default='cpu',
+                        help="training device, e.g. cpu or cuda:0 (latency is always measured on CPU)")
+    parser.add_argument('--no-export', action='store_true', help="skip ONNX export of the students")
+    args = parser.parse_args()
+
+    run_pipeline(weights=args.weights, sparsity_targets=args.sparsity, epochs=args.epochs,
+                 finetune_epochs=args.finetune_epochs, batch_size=args.batch, export=not args.no_export,
+                 device=args.device)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 import streamlit as st
-import torch
 from PIL import Image
 import json
 import random
+from pathlib import Path
+from cascade_gate import DETECTOR_IMG_SIZE, GATE_WEIGHTS, gate_score, gate_transform, load_detector, load_gate
 
 def show_testing_interface():
     st.header("📷 اختبار صورة لاكتشاف العيب وتقديم التوصية")
@@ -17,22 +18,32 @@ def show_testing_interface():
         image = Image.open(uploaded_file)
         st.image(image, caption='📸 الصورة المرفوعة', use_container_width=True)
         
+        # وضع التتالي: مصنف صغير يقرر أولاً هل يوجد عيب قبل تشغيل الكاشف الكامل
+        cascade_mode = st.checkbox(
+            "⚡ وضع التتالي (فحص سريع قبل الكشف الكامل)",
+            value=Path(GATE_WEIGHTS).exists(),
+            disabled=not Path(GATE_WEIGHTS).exists(),
+            key="cascade_mode"
+        )
+        
         if st.button('🔍 كشف العيوب', key='detect_button'):
             with st.spinner('🧠 جاري تحليل الصورة...'):
                 try:
-                    # تحميل نموذج YOLOv5 مخصص (تأكد من مسار النموذج)
-                    model = torch.hub.load(
-                        'ultralytics/yolov5', 'custom',
-                        path='yolov5/runs/train/road_defects_model4/weights/best.pt',
-                        force_reload=False
-                    )
-                    model.conf = 0.01  # عتبة الثقة منخفضة لإظهار كل النتائج المحتملة
-                    model.iou = 0.45
-                    
                     if image.mode != 'RGB':
                         image = image.convert('RGB')
                     
-                    results = model(image, size=640)
+                    if cascade_mode:
+                        gate, checkpoint = load_gate(GATE_WEIGHTS)
+                        score = gate_score(gate, image, gate_transform(checkpoint['img_size']))
+                        if score < checkpoint['threshold']:
+                            st.subheader("🧠 نتائج الكشف")
+                            st.success(f"✅ لا يبدو أن الصورة تحتوي على عيوب (درجة الفحص السريع: {score:.2f})")
+                            return
+                    
+                    # تحميل نموذج YOLOv5 مخصص بنفس الإعدادات المستخدمة في تقييم وضع التتالي
+                    model = load_detector()
+                    
+                    results = model(image, size=DETECTOR_IMG_SIZE)
                     detected_boxes = results.xyxy[0]
                     
                     st.subheader("🧠 نتائج الكشف")
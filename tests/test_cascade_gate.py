@@ -0,0 +1,94 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from cascade_gate import background_tiles, calibrate_threshold, load_split
+
+class TestCalibrateThreshold(unittest.TestCase):
+    def test_no_positives(self):
+        """Test that the default threshold is used when there are no positives."""
+        self.assertEqual(calibrate_threshold([], []), 0.5)
+        self.assertEqual(calibrate_threshold([0.2, 0.9], [0, 0]), 0.5)
+
+    def test_all_scores_equal(self):
+        """Test that equal scores give that score as the threshold."""
+        self.assertEqual(calibrate_threshold([0.7] * 5, [1] * 5, target_recall=0.5), 0.7)
+
+    def test_ceil_boundary(self):
+        """Test that the number of positives kept is rounded up."""
+        scores = [i / 10 for i in range(1, 11)]
+        labels = [1] * 10
+        # 0.9 * 10 = 9 positives exactly, the 9th best score is 0.2
+        self.assertEqual(calibrate_threshold(scores, labels, target_recall=0.9), 0.2)
+        # 0.95 * 10 = 9.5 rounds up to 10, so every positive must pass
+        self.assertEqual(calibrate_threshold(scores, labels, target_recall=0.95), 0.1)
+
+    def test_negatives_ignored(self):
+        """Test that scores of clean images do not move the threshold."""
+        self.assertEqual(calibrate_threshold([0.9, 0.8, 0.1], [1, 1, 0], target_recall=1.0), 0.8)
+
+class TestLoadSplit(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary split with empty, missing and non-empty label files."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp.name)
+        img_dir = self.data_dir / 'images' / 'train'
+        label_dir = self.data_dir / 'labels' / 'train'
+        img_dir.mkdir(parents=True)
+        label_dir.mkdir(parents=True)
+
+        for name in ['clean.jpg', 'defect.jpg', 'unlabelled.jpg', 'notes.txt']:
+            (img_dir / name).write_bytes(b'')
+        (label_dir / 'clean.txt').write_text('', encoding='utf-8')
+        (label_dir / 'defect.txt').write_text('5 0.5 0.5 0.1 0.1\n', encoding='utf-8')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_labels(self):
+        """Test that empty labels are clean, non-empty labels are defects and unlabelled images are skipped."""
+        samples = {path.name: label for path, label in load_split('train', self.data_dir)}
+        self.assertEqual(samples, {'clean.jpg': 0, 'defect.jpg': 1})
+
+    def test_missing_split(self):
+        """Test that a split without images gives no samples."""
+        self.assertEqual(load_split('val', self.data_dir), [])
+
+class TestBackgroundTiles(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary split with real, placeholder and empty labels."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp.name)
+        img_dir = self.data_dir / 'images' / 'train'
+        self.label_dir = self.data_dir / 'labels' / 'train'
+        img_dir.mkdir(parents=True)
+        self.label_dir.mkdir(parents=True)
+
+        labels = {
+            'corner': '5 0.1 0.1 0.1 0.1\n',
+            'placeholder': '0 0.5 0.5 0.1 0.1\n',
+            'clean': '',
+        }
+        for name, text in labels.items():
+            (img_dir / f'{name}.jpg').write_bytes(b'')
+            (self.label_dir / f'{name}.txt').write_text(text, encoding='utf-8')
+        (img_dir / 'unlabelled.jpg').write_bytes(b'')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_tiles_avoid_boxes(self):
+        """Test that only tiles clear of the labelled box are returned."""
+        tiles = background_tiles('train', self.data_dir, grid=3)
+        self.assertEqual({path.name for path, _ in tiles}, {'corner.jpg'})
+        self.assertEqual(len(tiles), 8)
+        self.assertNotIn((0.0, 0.0, 1 / 3, 1 / 3), [tile for _, tile in tiles])
+
+    def test_box_across_tiles(self):
+        """Test that a box crossing tile borders removes every tile it touches."""
+        (self.label_dir / 'corner.txt').write_text('5 0.5 0.5 0.5 0.5\n', encoding='utf-8')
+        # The box spans 0.25-0.75 on both axes and touches all nine tiles
+        self.assertEqual(background_tiles('train', self.data_dir, grid=3), [])
+
+if __name__ == '__main__':
+    unittest.main()
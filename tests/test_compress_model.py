@@ -0,0 +1,119 @@
+import unittest
+
+import torch
+import torch.nn as nn
+
+from compress_model import (STUDENT_BASE_CFG, YOLOV5_DIR, add_yolov5_to_path, distillation_loss,
+                            mark_pareto, prune_channels)
+
+# The YOLOv5 clone is created by setup_yolov5.py
+YOLOV5_AVAILABLE = (YOLOV5_DIR / "models").exists()
+
+def make_row(name, params, gflops, cpu_ms, map50_95):
+    return {'name': name, 'params': params, 'gflops': gflops, 'cpu_ms': cpu_ms, 'map50_95': map50_95}
+
+class TestMarkPareto(unittest.TestCase):
+    def test_dominated_candidate(self):
+        """Test that a candidate beaten on every axis is not on the Pareto front."""
+        rows = mark_pareto([
+            make_row('small', 1, 1.0, 10.0, 0.5),
+            make_row('worse', 2, 2.0, 20.0, 0.4),
+            make_row('accurate', 3, 3.0, 30.0, 0.6),
+        ])
+        self.assertEqual({r['name']: r['pareto'] for r in rows},
+                         {'small': True, 'worse': False, 'accurate': True})
+
+    def test_ties(self):
+        """Test that identical candidates do not dominate each other."""
+        rows = mark_pareto([make_row('a', 1, 1.0, 10.0, 0.5), make_row('b', 1, 1.0, 10.0, 0.5)])
+        self.assertTrue(all(r['pareto'] for r in rows))
+
+    def test_better_on_one_axis(self):
+        """Test that equal on all axes but one is enough to dominate."""
+        rows = mark_pareto([make_row('fast', 1, 1.0, 5.0, 0.5), make_row('slow', 1, 1.0, 10.0, 0.5)])
+        self.assertEqual([r['pareto'] for r in rows], [True, False])
+
+class TestPruneChannels(unittest.TestCase):
+    def make_model(self):
+        """Tiny detector with the YOLOv5 layout: layers in `model`, head last."""
+        class TinyDetector(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.model = nn.Sequential(
+                    nn.Sequential(nn.Conv2d(3, 16, 3, padding=1, bias=False), nn.BatchNorm2d(16), nn.SiLU()),
+                    nn.Sequential(nn.Conv2d(16, 32, 3, 2, padding=1, bias=False), nn.BatchNorm2d(32), nn.SiLU()),
+                    nn.Conv2d(32, 19, 1),
+                )
+
+            def forward(self, x):
+                return self.model(x)
+
+        return TinyDetector()
+
+    def test_channels_removed(self):
+        """Test that the requested fraction of channels is removed from each layer."""
+        model = prune_channels(self.make_model(), 0.5, imgsz=32)
+        self.assertEqual(model.model[0][0].out_channels, 8)
+        self.assertEqual(model.model[0][1].num_features, 8)
+        self.assertEqual(model.model[1][0].out_channels, 16)
+        self.assertEqual(model.model[2].in_channels, 16)
+        self.assertEqual(model(torch.zeros(1, 3, 32, 32)).shape, (1, 19, 16, 16))
+
+    def test_frozen_parameters(self):
+        """Test that channels are removed from a frozen model, as stored in best.pt."""
+        model = self.make_model()
+        model.requires_grad_(False)
+        model = prune_channels(model, 0.5, imgsz=32)
+        self.assertEqual(model.model[0][0].out_channels, 8)
+        self.assertEqual(model.model[1][0].out_channels, 16)
+
+    def test_head_untouched(self):
+        """Test that the output channels of the head are kept."""
+        model = prune_channels(self.make_model(), 0.5, imgsz=32)
+        self.assertEqual(model.model[2].out_channels, 19)
+
+    def test_invalid_sparsity(self):
+        """Test that sparsity outside [0, 1) is rejected."""
+        for sparsity in (-0.1, 1.0):
+            with self.assertRaises(ValueError):
+                prune_channels(self.make_model(), sparsity, imgsz=32)
+
+@unittest.skipUnless(YOLOV5_AVAILABLE, "YOLOv5 clone not found, run setup_yolov5.py")
+class TestPruneYolov5(unittest.TestCase):
+    def test_prune_yolov5s(self):
+        """Test pruning a frozen YOLOv5s with C3, Concat and Detect layers."""
+        add_yolov5_to_path()
+        from models.yolo import Model
+
+        model = Model(str(STUDENT_BASE_CFG), ch=3, nc=14)
+        model.requires_grad_(False)
+        n_params = sum(p.numel() for p in model.parameters())
+        detect_out = [m.out_channels for m in model.model[-1].m]
+
+        model = prune_channels(model, 0.25, imgsz=64)
+        self.assertLess(sum(p.numel() for p in model.parameters()), n_params)
+        self.assertEqual([m.out_channels for m in model.model[-1].m], detect_out)
+
+        model.eval()
+        with torch.no_grad():
+            pred = model(torch.zeros(1, 3, 64, 64))[0]
+        # 3 anchors on 8x8, 4x4 and 2x2 grids, each with 4 box + 1 objectness + 14 class values
+        self.assertEqual(tuple(pred.shape), (1, 3 * (64 + 16 + 4), 19))
+
+class TestDistillationLoss(unittest.TestCase):
+    def test_zero_when_student_matches_teacher(self):
+        """Test that the loss vanishes when the student reproduces the teacher."""
+        torch.manual_seed(0)
+        teacher_out = [torch.randn(2, 3, 4, 4, 19), torch.randn(2, 3, 2, 2, 19)]
+        student_out = [t.clone() for t in teacher_out]
+        self.assertAlmostEqual(distillation_loss(student_out, teacher_out).item(), 0.0, places=5)
+
+    def test_positive_when_student_differs(self):
+        """Test that a different student is penalised."""
+        torch.manual_seed(0)
+        teacher_out = [torch.randn(2, 3, 4, 4, 19)]
+        student_out = [torch.randn(2, 3, 4, 4, 19)]
+        self.assertGreater(distillation_loss(student_out, teacher_out).item(), 0.0)
+
+if __name__ == '__main__':
+    unittest.main()